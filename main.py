@@ -1,10 +1,14 @@
 #!/usr/bin/env python3
 
+import io
+import mmap
 import os
 import re
 import sys
+from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional
+from typing import Any, Iterator, Optional, Union
 
 import msgspec
 from packaging.version import parse as parse_version
@@ -12,32 +16,110 @@ from packaging.version import parse as parse_version
 VERSION_RE = re.compile(
     "^{version} *= *{spec}".format(
         version="(?:__version__|version)",
-        spec=r"""(["'])((?:(?!\1).)*)\1""",
+        spec=r"""(?:"([^"\n]*)"|'([^'\n]*)')""",
     ),
     re.MULTILINE,
 )
 
+# Changes files at least this large are memory-mapped instead of read whole
+MMAP_THRESHOLD = 1 << 20
+
+
+# Bytes that str.isspace treats as whitespace (bytes.isspace misses \x1c-\x1f)
+_ASCII_SPACE = frozenset(i for i in range(128) if chr(i).isspace())
+
+
+_NON_ASCII_RE = re.compile(rb"[\x80-\xff]")
+
+
+def _decode(data: bytes) -> str:
+    # Match the universal newlines translation done by text mode reads
+    return data.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+
+
+@lru_cache(maxsize=32)
+def _compile_head_re(head_line: str, name: str) -> re.Pattern[str]:
+    return re.compile(
+        head_line.format(
+            version=r"\[(?P<version>[0-9][0-9.abcr]+(\.post[0-9]+)?)\]",
+            date=r"\d+-\d+-\d+",
+            name=name,
+        ),
+        re.MULTILINE,
+    )
+
+
+@lru_cache(maxsize=32)
+def _compile_head_re_bytes(head_line: str, name: str) -> Optional[re.Pattern[bytes]]:
+    # A bytes pattern only behaves like the str one for ASCII patterns
+    pattern = _compile_head_re(head_line, name).pattern
+    if not pattern.isascii():
+        return None
+    try:
+        return re.compile(pattern.encode("ascii"), re.MULTILINE)
+    except re.error:
+        # str-only escapes such as \u or \N{...}
+        return None
+
+
+@lru_cache(maxsize=16)
+def _compile_fix_issue_re(fix_issue_regex: str) -> re.Pattern[str]:
+    return re.compile(fix_issue_regex)
+
+
+def _find_heads(
+    head_re: re.Pattern[Any], buf: Union[str, memoryview]
+) -> Optional[tuple[re.Match[Any], int, int]]:
+    """Match the head at the start of buf, its record end and the scanned length"""
+    # One pass over the buffer yields both this and the previous release head
+    heads = head_re.finditer(buf)
+    match = next(heads, None)
+    if match is None or match.start() != 0:
+        return None
+    match2 = next(heads, None)
+    if match2 is None:
+        # There is the only release record
+        return match, len(buf), len(buf)
+    # There are older release records
+    return match, match2.start(), match2.end()
+
 
 class Context(msgspec.Struct):
     root: Path
     version: str = ""
 
     def read_file(self, name: str) -> str:
-        fname = self.root / name
-        if not fname.exists():
-            raise ValueError(f"file '{name}' doesn't exist")
-        return fname.read_text("utf-8")
-
-
-class Output(msgspec.Struct, frozen=True):
-    version: str
-    pre_release: bool
-    dev_release: bool
-
-    def show(self) -> None:
-        print(f"::set-output name=version::{self.version}")
-        print(f"::set-output name=prerelease::{str(self.pre_release).lower()}")
-        print(f"::set-output name=devrelease::{str(self.dev_release).lower()}")
+        try:
+            with open(os.path.join(self.root, name), "rb") as f:
+                return _decode(f.read())
+        except FileNotFoundError:
+            raise ValueError(f"file '{name}' doesn't exist") from None
+
+    def write_file(self, name: str, text: str) -> None:
+        data = memoryview(text.encode("utf-8"))
+        path = os.path.join(self.root, name)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            while data:
+                data = data[os.write(fd, data) :]
+        finally:
+            os.close(fd)
+
+    @contextmanager
+    def read_file_mmap(
+        self, name: str, threshold: int = MMAP_THRESHOLD
+    ) -> Iterator[Union[str, mmap.mmap]]:
+        """Map the file read-only, or yield its text if it is below the threshold"""
+        try:
+            f = open(os.path.join(self.root, name), "rb")
+        except FileNotFoundError:
+            raise ValueError(f"file '{name}' doesn't exist") from None
+        with f:
+            if os.fstat(f.fileno()).st_size < threshold:
+                yield _decode(f.read())
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                yield mm
 
 
 class Parser:
@@ -85,10 +167,92 @@ class Parser:
                 raise ValueError("version and version_file arguments are ambiguous")
             return version
         txt = ctx.read_file(version_file)
-        if match := VERSION_RE.search(txt):
-            return match.group(2)
+        # VERSION_RE is anchored at line starts, so only lines with one of
+        # the known prefixes can match and the rest are skipped cheaply
+        for line in io.StringIO(txt):
+            if not line.startswith(("__version__", "version")):
+                continue
+            if match := VERSION_RE.match(line):
+                # Only one of the double/single quoted groups participates
+                double_quoted = match.group(1)
+                return double_quoted if double_quoted is not None else match.group(2)
         raise ValueError(f"Unable to determine version in file '{version_file}'")
 
+    def _start_mark_error(self, start_line: str) -> ValueError:
+        return ValueError(
+            f"Cannot find TOWNCRIER start mark ({start_line!r}) "
+            f"in file '{self.changes_file}'"
+        )
+
+    def _head_mark_error(self, head_line: str) -> ValueError:
+        head_re = _compile_head_re(head_line, self.name)
+        return ValueError(
+            f"Cannot find TOWNCRIER version head mark ({head_re.pattern!r}) "
+            f"in file '{self.changes_file}'"
+        )
+
+    def _extract_text(
+        self, changes: str, *, start_line: str, head_line: str
+    ) -> tuple[str, str]:
+        idx = changes.find(start_line)
+        if idx < 0:
+            raise self._start_mark_error(start_line)
+
+        pos = idx + len(start_line)
+        size = len(changes)
+        while pos < size and changes[pos].isspace():
+            pos += 1
+        # A single slice starting at the head, so '^' in head_line anchors
+        # there even when it is indented or shares a line with the start mark
+        return self._extract_record(changes[pos:], head_line=head_line)
+
+    def _extract_record(self, msg: str, *, head_line: str) -> tuple[str, str]:
+        heads = _find_heads(_compile_head_re(head_line, self.name), msg)
+        if heads is None:
+            raise self._head_mark_error(head_line)
+        match, end, _ = heads
+        return match.group("version"), msg[match.end() : end]
+
+    def _extract_mmap(
+        self, mm: mmap.mmap, *, start_line: str, head_line: str
+    ) -> tuple[str, str]:
+        head_re = _compile_head_re_bytes(head_line, self.name)
+        if head_re is None or mm.find(b"\r") >= 0:
+            # Newlines must be translated before the start mark can be found,
+            # and non-ASCII patterns need str matching semantics
+            return self._extract_text(
+                _decode(mm[:]), start_line=start_line, head_line=head_line
+            )
+
+        marker = start_line.encode("utf-8")
+        idx = mm.find(marker)
+        if idx < 0:
+            raise self._start_mark_error(start_line)
+
+        pos = idx + len(marker)
+        size = len(mm)
+        while pos < size and mm[pos] in _ASCII_SPACE:
+            pos += 1
+        # A view starting at the head anchors '^' there without copying the
+        # tail; it is released on exit so the mapping can still be closed
+        with memoryview(mm)[pos:] as view:
+            heads = _find_heads(head_re, view)
+            if heads is not None:
+                match, end, scanned = heads
+                # \d, \s, \w and '.' only agree with the str pattern on ASCII,
+                # so everything the matcher looked at has to be ASCII
+                line_end = mm.find(b"\n", pos + scanned)
+                if line_end >= 0:
+                    scanned = line_end - pos
+                if _NON_ASCII_RE.search(view, 0, scanned) is None:
+                    # Groups of a memoryview match are memoryviews themselves
+                    version = bytes(match.group("version")).decode("ascii")
+                    record = view[match.end() : end].tobytes().decode("ascii")
+                    return version, record
+        return self._extract_text(
+            _decode(mm[idx:]), start_line=start_line, head_line=head_line
+        )
+
     def parse(
         self,
         ctx: Context,
@@ -109,43 +273,19 @@ class Parser:
                 "fix_issue_regex and fix_issue_repl should be used together"
             )
         self.check_head(ctx.version, input_check_ref)
-        changes = ctx.read_file(self.changes_file)
-
-        _, sep, msg = changes.partition(start_line)
-        if not sep:
-            raise ValueError(
-                f"Cannot find TOWNCRIER start mark ({start_line!r}) "
-                "in file '{changes_file}'"
-            )
-
-        msg = msg.strip()
-        head_re = re.compile(
-            head_line.format(
-                version=r"\[(?P<version>[0-9][0-9.abcr]+(\.post[0-9]+)?)\]",
-                date=r"\d+-\d+-\d+",
-                name=self.name,
-            ),
-            re.MULTILINE,
-        )
-        match = head_re.match(msg)
-        if match is None:
-            raise ValueError(
-                f"Cannot find TOWNCRIER version head mark ({head_re.pattern!r}) "
-                f"in file '{self.changes_file}'"
-            )
-        found_version = match.group("version")
+        with ctx.read_file_mmap(self.changes_file) as changes:
+            if isinstance(changes, str):
+                found_version, msg = self._extract_text(
+                    changes, start_line=start_line, head_line=head_line
+                )
+            else:
+                found_version, msg = self._extract_mmap(
+                    changes, start_line=start_line, head_line=head_line
+                )
         self.check_changes_version(ctx.version, found_version)
 
-        match2 = head_re.search(msg, match.end())
-        if match2 is not None:
-            # There are older release records
-            msg = msg[match.end() : match2.start()]
-        else:
-            # There is the only release record
-            msg = msg[match.end() :]
-
         if fix_issue_regex:
-            msg = re.sub(fix_issue_regex, fix_issue_repl, msg)
+            msg = _compile_fix_issue_re(fix_issue_regex).sub(fix_issue_repl, msg)
         return msg.strip()
 
 
@@ -165,7 +305,6 @@ class Controller:
             version_file=os.environ["INPUT_VERSION_FILE"],
             version=os.environ["INPUT_VERSION"],
         )
-        version = parse_version(self.ctx.version)
 
         note = self.parser.parse(
             self.ctx,
@@ -176,15 +315,18 @@ class Controller:
             input_check_ref=os.environ["INPUT_CHECK_REF"],
         )
 
-        output = Output(
-            version=self.ctx.version,
-            pre_release=version.is_prerelease,
-            dev_release=version.is_devrelease,
+        # Only parsed once the notes are extracted, so failed runs skip it
+        version = parse_version(self.ctx.version)
+        pre_release = "true" if version.is_prerelease else "false"
+        dev_release = "true" if version.is_devrelease else "false"
+        sys.stdout.write(
+            f"::set-output name=version::{self.ctx.version}\n"
+            f"::set-output name=prerelease::{pre_release}\n"
+            f"::set-output name=devrelease::{dev_release}\n"
         )
-        output.show()
 
         output_file = os.environ["INPUT_OUTPUT_FILE"]
-        (self.root / output_file).write_text(note)
+        self.ctx.write_file(output_file, note)
 
 
 def main() -> int: